@@ -0,0 +1,528 @@
+"""
+Offline benchmark suite for the Enhanced Coaching Bot
+
+Runs the real pipeline from main.py against local stand-ins (fake OpenAI
+embedding/chat models, an in-memory vector store and a mock Telegram API),
+so no credentials or network access are needed. Results are printed as
+JSON so runs can be compared between releases.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --requests 500 --concurrency 32 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import math
+import random
+import shutil
+import statistics
+import subprocess
+import asyncio
+import hashlib
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import main
+
+FAKE_ENV = {key: "offline-benchmark"
+            for key in ("PINECONE_API_KEY", "OPENAI_API_KEY", "TELEGRAM_BOT_TOKEN")}
+
+# ------------------ Offline stand-ins ------------------
+
+
+class FakeEmbeddings:
+    """Deterministic hash-based embedding model"""
+
+    def __init__(self, dimension: int, latency: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency
+        self.calls = 0
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        values = [rng.uniform(-1.0, 1.0) for _ in range(self.dimension)]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+    def create(self, input, model: str):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        texts = input if isinstance(input, list) else [input]
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=self._vector(t), index=i) for i, t in enumerate(texts)],
+            usage=SimpleNamespace(prompt_tokens=sum(len(t) // 4 for t in texts),
+                                  total_tokens=sum(len(t) // 4 for t in texts))
+        )
+
+
+class FakeChatCompletions:
+    """Chat model returning a canned answer"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def create(self, model: str, messages: List[Dict], **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = messages[-1]["content"]
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(
+                content=f"Offline answer ({len(prompt)} prompt chars)"))],
+            usage=SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=20)
+        )
+
+
+class FakeOpenAI:
+    """Drop-in replacement for the OpenAI client"""
+
+    def __init__(self, dimension: int, embed_latency: float = 0.0, chat_latency: float = 0.0):
+        self.embeddings = FakeEmbeddings(dimension, embed_latency)
+        self.chat = SimpleNamespace(completions=FakeChatCompletions(chat_latency))
+
+
+class InMemoryIndex:
+    """Minimal in-memory stand-in for a Pinecone index (cosine similarity)"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.vectors: Dict[str, Dict] = {}
+
+    def upsert(self, vectors: List[Dict]):
+        if self.latency:
+            time.sleep(self.latency)
+        for vector in vectors:
+            self.vectors[vector["id"]] = vector
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids: List[str]):
+        for vector_id in ids:
+            self.vectors.pop(vector_id, None)
+
+    def query(self, vector: List[float], top_k: int, include_metadata: bool = False):
+        if self.latency:
+            time.sleep(self.latency)
+        scored = []
+        for item in list(self.vectors.values()):
+            score = sum(a * b for a, b in zip(vector, item["values"]))
+            scored.append((score, item))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        matches = []
+        for score, item in scored[:top_k]:
+            match = {"id": item["id"], "score": score}
+            if include_metadata:
+                match["metadata"] = item["metadata"]
+            matches.append(match)
+        return {"matches": matches}
+
+    def describe_index_stats(self):
+        return {"total_vector_count": len(self.vectors), "index_fullness": 0.0,
+                "dimension": main.Config.EMBEDDING_DIMENSION}
+
+
+class FakePinecone:
+    """Drop-in replacement for the Pinecone client"""
+
+    def __init__(self, latency: float = 0.0):
+        self._indexes: Dict[str, InMemoryIndex] = {}
+        self._latency = latency
+
+    def list_indexes(self):
+        names = list(self._indexes)
+        return SimpleNamespace(names=lambda: names)
+
+    def create_index(self, name: str, **kwargs):
+        self._indexes[name] = InMemoryIndex(self._latency)
+
+    def Index(self, name: str) -> InMemoryIndex:
+        if name not in self._indexes:
+            self.create_index(name)
+        return self._indexes[name]
+
+
+class MockTelegram:
+    """Replaces send_telegram_message and records outgoing messages"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sent = 0
+
+    async def send_message(self, chat_id: int, text: str) -> bool:
+        with main.metrics.time("send"):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        self.sent += 1
+        return True
+
+
+def install_stubs(args) -> Dict:
+    """Point main.py at the offline stand-ins"""
+    stubs = {
+        "openai": FakeOpenAI(args.embedding_dimension, args.embed_latency_ms / 1000,
+                             args.chat_latency_ms / 1000),
+        "pinecone": FakePinecone(args.vector_latency_ms / 1000),
+        "telegram": MockTelegram(args.send_latency_ms / 1000),
+    }
+    main.client = stubs["openai"]
+    main.pc = stubs["pinecone"]
+    main.pinecone_index = None
+    main.send_telegram_message = stubs["telegram"].send_message
+    return stubs
+
+# ------------------ Helpers ------------------
+
+
+SENTENCES = [
+    "Fill half your plate with vegetables and fruits.",
+    "Choose whole grains over refined grains whenever possible.",
+    "Plan meals for the week to avoid buying food you will not use.",
+    "Drink water instead of sugary drinks!",
+    "Store leftovers in clear containers so you remember to eat them.",
+    "Is it better to shop more often and buy less each time?",
+    "Limit red meat and avoid processed meats such as bacon.",
+    "Use healthy oils like olive and canola for cooking and on salads.",
+]
+
+
+def synthetic_text(size: int, seed: int = 0) -> str:
+    """Generate roughly size characters of sentence-structured text"""
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    while total < size:
+        sentence = rng.choice(SENTENCES)
+        parts.append(sentence)
+        total += len(sentence) + 1
+    return " ".join(parts)
+
+
+def percentiles(samples: List[float]) -> Dict:
+    """Summarize latency samples (seconds) as millisecond percentiles"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+async def asgi_request(method: str, path: str, query_string: str = "",
+                       body: Optional[Dict] = None) -> int:
+    """Send one HTTP request straight into the ASGI app and return the status"""
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": query_string.encode("ascii"),
+        "headers": [(b"host", b"benchmark"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode("ascii"))],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    sent_body = False
+    status = {"code": 0}
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await main.app(scope, receive, send)
+    return status["code"]
+
+
+async def run_load(make_request, total: int, concurrency: int) -> Dict:
+    """Run total requests with bounded concurrency and collect latencies"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            status = await make_request(i)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+
+    result = percentiles(latencies)
+    result.update({
+        "concurrency": concurrency,
+        "errors": errors,
+        "requests_per_sec": round(total / elapsed, 2) if elapsed else None,
+    })
+    return result
+
+# ------------------ Benchmarks ------------------
+
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import main
+print(time.perf_counter() - start)
+"""
+
+COLD_START_SNIPPET = """
+import time
+start = time.perf_counter()
+import main
+main.get_openai()
+main.get_pinecone()
+import PyPDF2, docx
+print(time.perf_counter() - start)
+"""
+
+
+def _time_subprocess(snippet: str, runs: int) -> Dict:
+    """Run a snippet in fresh interpreters and summarize the printed seconds"""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, **FAKE_ENV)
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", snippet], cwd=cwd, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return {
+        "runs": runs,
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "min_ms": round(min(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+def bench_startup(args) -> Dict:
+    """
+    Measure import time of main.py and the cold start cost of creating the
+    OpenAI/Pinecone clients and loading the extractor libraries
+    """
+    return {
+        "import": _time_subprocess(IMPORT_SNIPPET, args.startup_runs),
+        "cold_start": _time_subprocess(COLD_START_SNIPPET, args.startup_runs),
+    }
+
+
+def bench_chunking(args) -> Dict:
+    """Measure smart_chunk_text throughput in MB/sec"""
+    text = synthetic_text(int(args.chunk_mb * 1024 * 1024))
+    size_mb = len(text.encode("utf-8")) / (1024 * 1024)
+
+    start = time.perf_counter()
+    chunks = main.smart_chunk_text(text)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "input_mb": round(size_mb, 3),
+        "chunks": len(chunks),
+        "seconds": round(elapsed, 4),
+        "mb_per_sec": round(size_mb / elapsed, 3) if elapsed else None,
+    }
+
+
+def bench_ingestion(args, workdir: str) -> Dict:
+    """Measure ingest_documents throughput in docs/sec on a fresh index"""
+    docs_path = os.path.join(workdir, "docs")
+    os.makedirs(docs_path, exist_ok=True)
+    for i in range(args.docs):
+        with open(os.path.join(docs_path, f"doc_{i:04d}.txt"), "w", encoding="utf-8") as f:
+            f.write(synthetic_text(args.doc_kb * 1024, seed=i))
+
+    start = time.perf_counter()
+    asyncio.run(main.ingest_documents(docs_path))
+    elapsed = time.perf_counter() - start
+
+    index = main.pc.Index(main.Config.INDEX_NAME)
+    return {
+        "documents": args.docs,
+        "doc_kb": args.doc_kb,
+        "vectors": len(index.vectors),
+        "seconds": round(elapsed, 4),
+        "docs_per_sec": round(args.docs / elapsed, 2) if elapsed else None,
+    }
+
+
+def bench_search(args) -> Dict:
+    """Measure /search latency percentiles under concurrent load"""
+    async def make_request(i: int) -> int:
+        query = f"How can I reduce food waste? variant {i % args.distinct_queries}"
+        return await asgi_request("GET", "/search", f"q={query.replace(' ', '+')}")
+
+    return asyncio.run(run_load(make_request, args.requests, args.concurrency))
+
+
+def bench_telegram(args) -> Dict:
+    """Measure /telegram-webhook latency percentiles under concurrent load"""
+    async def make_request(i: int) -> int:
+        update = {
+            "update_id": i,
+            "message": {
+                "text": f"What should be on a healthy plate? variant {i % args.distinct_queries}",
+                "chat": {"id": i % args.chats},
+                "from": {"username": f"bench{i % args.chats}"},
+            },
+        }
+        return await asgi_request("POST", "/telegram-webhook", body=update)
+
+    return asyncio.run(run_load(make_request, args.requests, args.concurrency))
+
+
+def bench_batch_search(args) -> Dict:
+    """Measure run_search_batch throughput in queries/sec"""
+    queries = [f"How do I plan healthy meals? variant {i % args.distinct_queries}"
+               for i in range(args.batch_queries)]
+    embed_calls = main.client.embeddings.calls
+
+    start = time.perf_counter()
+    results = main.run_search_batch(queries, generate=args.batch_generate,
+                                    concurrency=args.concurrency)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "queries": len(queries),
+        "generate": args.batch_generate,
+        "errors": sum(1 for item in results if "error" in item),
+        "embedding_calls": main.client.embeddings.calls - embed_calls,
+        "seconds": round(elapsed, 4),
+        "queries_per_sec": round(len(queries) / elapsed, 2) if elapsed else None,
+    }
+
+
+def run_benchmarks(args) -> Dict:
+    """Run the whole suite and return the results"""
+    workdir = tempfile.mkdtemp(prefix="coaching-bench-")
+    saved = {name: getattr(main.Config, name)
+             for name in ("HASHES_FILE", "TELEGRAM_OFFSET_FILE", "SHARED_STATE_DIR")}
+    main.Config.HASHES_FILE = os.path.join(workdir, "file_hashes.json")
+    main.Config.SHARED_STATE_DIR = os.path.join(workdir, "state")
+    main.Config.TELEGRAM_OFFSET_FILE = os.path.join(workdir, "telegram_offset.json")
+    main.metrics.enabled = not args.no_metrics
+
+    stubs = install_stubs(args)
+    if args.trace_memory:
+        tracemalloc.start()
+    try:
+        results = {
+            "startup": bench_startup(args),
+            "chunking": bench_chunking(args),
+            "ingestion": bench_ingestion(args, workdir),
+            "search": bench_search(args),
+            "telegram_webhook": bench_telegram(args),
+            "batch_search": bench_batch_search(args),
+        }
+        if args.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        for name, value in saved.items():
+            setattr(main.Config, name, value)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results["memory"] = {}
+    if args.trace_memory:
+        results["memory"]["tracemalloc_peak_mb"] = round(peak / (1024 * 1024), 3)
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+        results["memory"]["max_rss_mb"] = round(rss / divisor, 3)
+    except ImportError:
+        pass
+
+    results["upstream_calls"] = {
+        "embeddings": stubs["openai"].embeddings.calls,
+        "chat_completions": stubs["openai"].chat.completions.calls,
+        "telegram_messages": stubs["telegram"].sent,
+    }
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the coaching bot")
+    parser.add_argument("--startup-runs", type=int, default=5,
+                        help="fresh interpreters used to time import and cold start")
+    parser.add_argument("--docs", type=int, default=50, help="documents to ingest")
+    parser.add_argument("--doc-kb", type=int, default=20, help="size of each document in KB")
+    parser.add_argument("--chunk-mb", type=float, default=2.0, help="text size for the chunking benchmark")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent in-flight requests")
+    parser.add_argument("--distinct-queries", type=int, default=50,
+                        help="distinct query strings (lower values exercise coalescing)")
+    parser.add_argument("--batch-queries", type=int, default=1000,
+                        help="queries for the batch search benchmark")
+    parser.add_argument("--batch-generate", action="store_true",
+                        help="also generate responses in the batch search benchmark")
+    parser.add_argument("--chats", type=int, default=100, help="distinct Telegram chats")
+    parser.add_argument("--embedding-dimension", type=int, default=64,
+                        help="dimension of fake embeddings")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0)
+    parser.add_argument("--vector-latency-ms", type=float, default=0.0)
+    parser.add_argument("--send-latency-ms", type=float, default=0.0)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="report the Python heap peak via tracemalloc (slows every benchmark)")
+    parser.add_argument("--no-metrics", action="store_true", help="disable the metrics registry")
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None) -> None:
+    args = parse_args(argv)
+    # Keep per-request pipeline logging out of the measurements
+    main.logger.setLevel("WARNING")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "version": main.app.version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "results": run_benchmarks(args),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main_cli()
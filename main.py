@@ -3,15 +3,19 @@ import time
 import hashlib
 import json
 import logging
-import aiohttp
 import asyncio
-from typing import List, Dict, Optional
+import threading
+import contextlib
+import sqlite3
+import sys
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, List, Dict, Optional, Tuple
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
-from openai import OpenAI
-from PyPDF2 import PdfReader
-from docx import Document
+
+if TYPE_CHECKING:
+    import aiohttp
 
 # ------------------ Configuration ------------------
 
@@ -38,6 +42,39 @@ class Config:
     PINECONE_CLOUD = "aws"
     PINECONE_REGION = "us-east-1"
 
+    # Telegram long polling settings
+    TELEGRAM_POLL_TIMEOUT = 30  # seconds getUpdates waits for new updates
+    TELEGRAM_POLL_LIMIT = 100   # max updates per getUpdates batch
+    TELEGRAM_OFFSET_FILE = 'telegram_offset.json'
+    TELEGRAM_POLL_BACKOFF = 5       # initial delay after a failed poll (doubles)
+    TELEGRAM_POLL_MAX_BACKOFF = 60
+    TELEGRAM_MAX_IN_FLIGHT = 200    # updates handled at once before polling pauses
+
+    # Conversation memory settings
+    HISTORY_MAX_TURNS = 6          # recent turns kept verbatim per chat
+    HISTORY_SUMMARY_BATCH = 3      # oldest turns rolled into the summary at once
+    HISTORY_MAX_TURN_CHARS = 500   # query/answer text stored per turn
+    HISTORY_MAX_SUMMARY_CHARS = 800
+    HISTORY_MAX_CHATS = 20000      # active chats kept in memory (LRU)
+    HISTORY_DB_FILE = None         # e.g. 'conversations.db' to persist history
+
+    # Batch search settings
+    MAX_BATCH_QUERIES = 10000      # queries accepted per /search/batch request
+    EMBEDDING_BATCH_SIZE = 256     # inputs per embeddings API call
+    BATCH_QUERY_CONCURRENCY = 16   # concurrent vector queries / generations
+
+    # Metrics settings
+    METRICS_ENABLED = True
+    METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    # Health/stats snapshot settings
+    STATUS_REFRESH_INTERVAL = 15   # seconds between background refreshes
+    STATUS_MAX_STALENESS = 60      # snapshot older than this is reported unhealthy
+
+    # Multi-worker settings (locks and state shared between worker processes)
+    SHARED_STATE_DIR = '.coaching_bot_state'
+    WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))  # also read by gunicorn
+
 # ------------------ Setup logging ------------------
 
 
@@ -54,16 +91,79 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 
-# Validate required environment variables
-if not all([PINECONE_API_KEY, OPENAI_API_KEY, TELEGRAM_BOT_TOKEN]):
-    raise ValueError(
-        "Missing required environment variables: PINECONE_API_KEY, OPENAI_API_KEY, TELEGRAM_BOT_TOKEN"
-    )
+
+def validate_environment() -> None:
+    """
+    Validate required environment variables
+
+    Raises:
+        ValueError: If any API key is missing
+    """
+    if not all([PINECONE_API_KEY, OPENAI_API_KEY, TELEGRAM_BOT_TOKEN]):
+        raise ValueError(
+            "Missing required environment variables: PINECONE_API_KEY, OPENAI_API_KEY, TELEGRAM_BOT_TOKEN"
+        )
 
 # ------------------ Initialize clients ------------------
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Clients are created on first use so importing this module stays fast and
+# works without credentials (e.g. for chunking/extraction tooling)
+pc = None
+client = None
+pinecone_index = None
+_clients_lock = threading.Lock()
+
+
+def get_pinecone():
+    """
+    Get the shared Pinecone client, creating it on first use
+
+    Returns:
+        Pinecone: Pinecone client
+    """
+    global pc
+    if pc is None:
+        with _clients_lock:
+            if pc is None:
+                if not PINECONE_API_KEY:
+                    raise ValueError("Missing required environment variable: PINECONE_API_KEY")
+                from pinecone import Pinecone
+                pc = Pinecone(api_key=PINECONE_API_KEY)
+    return pc
+
+
+def get_openai():
+    """
+    Get the shared OpenAI client, creating it on first use
+
+    Returns:
+        OpenAI: OpenAI client
+    """
+    global client
+    if client is None:
+        with _clients_lock:
+            if client is None:
+                if not OPENAI_API_KEY:
+                    raise ValueError("Missing required environment variable: OPENAI_API_KEY")
+                from openai import OpenAI
+                client = OpenAI(api_key=OPENAI_API_KEY)
+    return client
+
+
+def get_index():
+    """
+    Get the app-lifetime Pinecone index handle, creating it on first use
+
+    Returns:
+        Index: Pinecone index for Config.INDEX_NAME
+    """
+    global pinecone_index
+    if pinecone_index is None:
+        pinecone_client = get_pinecone()
+        with _clients_lock:
+            if pinecone_index is None:
+                pinecone_index = pinecone_client.Index(Config.INDEX_NAME)
+    return pinecone_index
 
 # ------------------ FastAPI ------------------
 
@@ -73,6 +173,202 @@ app = FastAPI(
     version="2.0.0"
 )
 
+# ------------------ Metrics ------------------
+
+
+class _NoopTimer:
+    """Stage timer used when metrics are disabled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+class _StageTimer:
+    """Records stage latency and counts errors raised inside the block"""
+    __slots__ = ("_metrics", "_stage", "_start")
+
+    def __init__(self, metrics: "Metrics", stage: str):
+        self._metrics = metrics
+        self._stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._metrics.observe_latency(self._stage, time.perf_counter() - self._start)
+        if exc_type is not None:
+            self._metrics.inc_error(self._stage)
+        return False
+
+
+class Metrics:
+    """
+    In-process metrics registry rendered in Prometheus text format
+
+    Tracks per-stage latency histograms plus error, retry, cache hit and
+    OpenAI token counters. When disabled every call is a cheap no-op.
+    """
+
+    def __init__(self, enabled: bool = True, buckets=Config.METRICS_LATENCY_BUCKETS):
+        self.enabled = enabled
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # stage -> [bucket counts..., +Inf count], sum
+        self._histograms: Dict[str, List[int]] = {}
+        self._sums: Dict[str, float] = {}
+        # metric name -> {label tuple: value}
+        self._counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {}
+
+    def time(self, stage: str):
+        """
+        Context manager timing a pipeline stage
+
+        Args:
+            stage (str): Stage name (extract, chunk, embed, upsert, query, generate, send)
+        """
+        if not self.enabled:
+            return _NOOP_TIMER
+        return _StageTimer(self, stage)
+
+    def observe_latency(self, stage: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            counts = self._histograms.get(stage)
+            if counts is None:
+                counts = self._histograms[stage] = [0] * (len(self._buckets) + 1)
+                self._sums[stage] = 0.0
+            for i, bound in enumerate(self._buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[stage] += seconds
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        Increment a counter
+
+        Args:
+            name (str): Metric name without the coaching_bot_ prefix
+            value (float): Amount to add
+            **labels: Label values
+        """
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def inc_error(self, stage: str) -> None:
+        self.inc("errors_total", stage=stage)
+
+    def inc_retry(self, operation: str) -> None:
+        self.inc("retries_total", operation=operation)
+
+    def inc_cache_hit(self, cache: str) -> None:
+        self.inc("cache_hits_total", cache=cache)
+
+    def record_token_usage(self, usage, purpose: str) -> None:
+        """
+        Count OpenAI token usage from a response's usage object
+
+        Args:
+            usage: OpenAI usage object (may be None)
+            purpose (str): What the call was for (embedding, generation, ...)
+        """
+        if not self.enabled or usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        self.inc("openai_tokens_total", prompt_tokens, purpose=purpose, type="prompt")
+        if completion_tokens:
+            self.inc("openai_tokens_total", completion_tokens, purpose=purpose, type="completion")
+
+    def export_state(self) -> Dict:
+        """
+        Snapshot all metric values as JSON-serializable data
+
+        Returns:
+            dict: Histogram counts, sums and counters
+        """
+        with self._lock:
+            return {
+                "histograms": {stage: list(counts) for stage, counts in self._histograms.items()},
+                "sums": dict(self._sums),
+                "counters": {name: [[list(map(list, key)), value] for key, value in series.items()]
+                             for name, series in self._counters.items()}
+            }
+
+    def render(self, states: Optional[List[Dict]] = None) -> str:
+        """
+        Render metrics in Prometheus text exposition format
+
+        Args:
+            states (List[Dict]): States from export_state() to sum together
+                (e.g. one per worker); defaults to this process only
+
+        Returns:
+            str: Metrics text
+        """
+        if states is None:
+            states = [self.export_state()]
+
+        histograms: Dict[str, List[int]] = {}
+        sums: Dict[str, float] = {}
+        counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {}
+        for state in states:
+            for stage, counts in state["histograms"].items():
+                merged = histograms.setdefault(stage, [0] * len(counts))
+                for i, count in enumerate(counts):
+                    merged[i] += count
+                sums[stage] = sums.get(stage, 0.0) + state["sums"][stage]
+            for name, series in state["counters"].items():
+                merged_series = counters.setdefault(name, {})
+                for key, value in series:
+                    key = tuple(tuple(pair) for pair in key)
+                    merged_series[key] = merged_series.get(key, 0) + value
+
+        lines = []
+        if histograms:
+            lines.append("# HELP coaching_bot_stage_latency_seconds Latency of pipeline stages")
+            lines.append("# TYPE coaching_bot_stage_latency_seconds histogram")
+        for stage in sorted(histograms):
+            counts = histograms[stage]
+            cumulative = 0
+            for bound, count in zip(self._buckets, counts):
+                cumulative += count
+                lines.append(
+                    f'coaching_bot_stage_latency_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(
+                f'coaching_bot_stage_latency_seconds_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+            lines.append(
+                f'coaching_bot_stage_latency_seconds_sum{{stage="{stage}"}} {sums[stage]}')
+            lines.append(
+                f'coaching_bot_stage_latency_seconds_count{{stage="{stage}"}} {cumulative}')
+
+        for name in sorted(counters):
+            lines.append(f"# TYPE coaching_bot_{name} counter")
+            for key, value in sorted(counters[name].items()):
+                labels = ",".join(f'{k}="{v}"' for k, v in key)
+                lines.append(f"coaching_bot_{name}{{{labels}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(enabled=Config.METRICS_ENABLED)
+
 # ------------------ Utilities ------------------
 
 
@@ -123,8 +419,11 @@ def save_file_hashes(hashes: Dict[str, str]) -> None:
         hashes (dict): Dictionary of filename -> hash mappings
     """
     try:
-        with open(Config.HASHES_FILE, "w") as f:
+        # Write atomically so other workers never read a partial file
+        tmp_path = f"{Config.HASHES_FILE}.tmp"
+        with open(tmp_path, "w") as f:
             json.dump(hashes, f, indent=2)
+        os.replace(tmp_path, Config.HASHES_FILE)
         logger.info("File hashes saved successfully")
     except Exception as e:
         logger.error(f"Error saving file hashes: {e}")
@@ -154,6 +453,7 @@ def extract_text_from_file(file_path: str) -> str:
                 return f.read()
 
         elif ext == ".pdf":
+            from PyPDF2 import PdfReader
             reader = PdfReader(file_path)
             text = ""
             for page_num, page in enumerate(reader.pages):
@@ -166,6 +466,7 @@ def extract_text_from_file(file_path: str) -> str:
             return text
 
         elif ext == ".docx":
+            from docx import Document
             doc = Document(file_path)
             paragraphs = []
             for para in doc.paragraphs:
@@ -256,15 +557,40 @@ def embed_text(text: str) -> List[float]:
         List[float]: Embedding vector
     """
     try:
-        response = client.embeddings.create(
-            input=text,
-            model=Config.EMBEDDING_MODEL
-        )
+        with metrics.time("embed"):
+            response = get_openai().embeddings.create(
+                input=text,
+                model=Config.EMBEDDING_MODEL
+            )
+        metrics.record_token_usage(response.usage, "embedding")
         return response.data[0].embedding
     except Exception as e:
         logger.error(f"Error creating embedding: {e}")
         raise
 
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """
+    Get embeddings for several texts in a single OpenAI call
+
+    Args:
+        texts (List[str]): Texts to embed (at most EMBEDDING_BATCH_SIZE)
+
+    Returns:
+        List[List[float]]: Embedding vectors in input order
+    """
+    try:
+        with metrics.time("embed"):
+            response = get_openai().embeddings.create(
+                input=texts,
+                model=Config.EMBEDDING_MODEL
+            )
+        metrics.record_token_usage(response.usage, "embedding")
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    except Exception as e:
+        logger.error(f"Error creating batch embeddings: {e}")
+        raise
+
 # ------------------ Vector Cleanup Functions ------------------
 
 
@@ -334,7 +660,7 @@ async def cleanup_deleted_files(docs_path: str = Config.DOCS_FOLDER) -> None:
             logger.info(
                 f"Found {len(deleted_files)} deleted files: {deleted_files}")
 
-            index = pc.Index(Config.INDEX_NAME)
+            index = get_index()
 
             # Delete vectors for each deleted file
             for filename in deleted_files:
@@ -383,32 +709,51 @@ async def send_telegram_message(chat_id: int, text: str) -> bool:
         "parse_mode": "Markdown"
     }
 
+    # Imported on first use; it is a large part of the module's import time
+    import aiohttp
+
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload) as response:
-                if response.status == 200:
-                    logger.info(f"Message sent successfully to chat {chat_id}")
-                    return True
-                else:
-                    logger.error(
-                        f"Failed to send message to chat {chat_id}: {response.status}")
-                    return False
+        with metrics.time("send"):
+            async with aiohttp.ClientSession() as session:
+                async with session.post(url, json=payload) as response:
+                    if response.status == 200:
+                        logger.info(f"Message sent successfully to chat {chat_id}")
+                        return True
+                    else:
+                        logger.error(
+                            f"Failed to send message to chat {chat_id}: {response.status}")
+                        metrics.inc_error("send")
+                        return False
     except Exception as e:
         logger.error(f"Error sending Telegram message: {e}")
         return False
 
 # ------------------ Pinecone integration ------------------
 
+# Counters from the most recent ingestion run, reported by /stats
+ingestion_stats: Dict[str, Any] = {
+    "runs": 0,
+    "last_run_at": None,
+    "last_duration_seconds": None,
+    "processed_files": 0,
+    "unchanged_files": 0,
+    "skipped_files": 0,
+    "vectors_upserted": 0
+}
+
 
 async def ensure_index_exists() -> None:
     """
     Ensure Pinecone index exists, create if it doesn't
     """
     try:
-        existing_indexes = pc.list_indexes().names()
+        pinecone_client = get_pinecone()
+        existing_indexes = pinecone_client.list_indexes().names()
         if Config.INDEX_NAME not in existing_indexes:
+            from pinecone import ServerlessSpec
+
             logger.info(f"Creating index {Config.INDEX_NAME}...")
-            pc.create_index(
+            pinecone_client.create_index(
                 name=Config.INDEX_NAME,
                 dimension=Config.EMBEDDING_DIMENSION,
                 metric="cosine",
@@ -418,7 +763,7 @@ async def ensure_index_exists() -> None:
                 )
             )
             # Wait for index to be ready
-            while Config.INDEX_NAME not in pc.list_indexes().names():
+            while Config.INDEX_NAME not in pinecone_client.list_indexes().names():
                 logger.info("Waiting for index to be created...")
                 await asyncio.sleep(5)
             logger.info(f"Index {Config.INDEX_NAME} created successfully")
@@ -440,17 +785,20 @@ async def ingest_documents(docs_path: str = Config.DOCS_FOLDER) -> None:
         logger.error(f"Directory {docs_path} does not exist!")
         return
 
+    started = time.time()
     await ensure_index_exists()
 
     # First, cleanup vectors for deleted files
     await cleanup_deleted_files(docs_path)
 
-    index = pc.Index(Config.INDEX_NAME)
+    index = get_index()
     current_hashes = load_file_hashes()
     new_hashes = {}
 
     processed_files = 0
     skipped_files = 0
+    unchanged_files = 0
+    vectors_upserted = 0
 
     for fname in os.listdir(docs_path):
         path = os.path.join(docs_path, fname)
@@ -472,6 +820,8 @@ async def ingest_documents(docs_path: str = Config.DOCS_FOLDER) -> None:
         # Skip if file hasn't changed
         if fname in current_hashes and current_hashes[fname] == current_hash:
             logger.info(f"File {fname} unchanged, skipping")
+            metrics.inc_cache_hit("file_hash")
+            unchanged_files += 1
             continue
 
         # If file has changed, delete old vectors first
@@ -483,13 +833,15 @@ async def ingest_documents(docs_path: str = Config.DOCS_FOLDER) -> None:
             f"Processing {'changed' if fname in current_hashes else 'new'} file: {fname}")
 
         try:
-            text = extract_text_from_file(path)
+            with metrics.time("extract"):
+                text = extract_text_from_file(path)
             if not text.strip():
                 logger.warning(f"No text extracted from {fname}")
                 continue
 
             # Use smart chunking
-            chunks = smart_chunk_text(text)
+            with metrics.time("chunk"):
+                chunks = smart_chunk_text(text)
             if not chunks:
                 logger.warning(f"No chunks created from {fname}")
                 continue
@@ -520,7 +872,9 @@ async def ingest_documents(docs_path: str = Config.DOCS_FOLDER) -> None:
                 for i in range(0, len(vectors), batch_size):
                     batch = vectors[i:i + batch_size]
                     try:
-                        index.upsert(vectors=batch)
+                        with metrics.time("upsert"):
+                            index.upsert(vectors=batch)
+                        vectors_upserted += len(batch)
                         logger.info(
                             f"Upserted batch {i//batch_size + 1} for {fname}")
                     except Exception as e:
@@ -534,6 +888,15 @@ async def ingest_documents(docs_path: str = Config.DOCS_FOLDER) -> None:
             logger.error(f"Error processing {fname}: {e}")
 
     save_file_hashes(new_hashes)
+    ingestion_stats.update({
+        "runs": ingestion_stats["runs"] + 1,
+        "last_run_at": started,
+        "last_duration_seconds": round(time.time() - started, 3),
+        "processed_files": processed_files,
+        "unchanged_files": unchanged_files,
+        "skipped_files": skipped_files,
+        "vectors_upserted": vectors_upserted
+    })
     logger.info(
         f"Ingestion completed: {processed_files} files processed, {skipped_files} files skipped")
 
@@ -549,14 +912,8 @@ def query_index(query: str) -> Dict:
         dict: Query results
     """
     try:
-        index = pc.Index(Config.INDEX_NAME)
         vector = embed_text(query)
-
-        result = index.query(
-            vector=vector,
-            top_k=Config.TOP_K,
-            include_metadata=True
-        )
+        result = query_by_vector(vector)
 
         logger.info(
             f"Query executed successfully, found {len(result.get('matches', []))} matches")
@@ -567,6 +924,24 @@ def query_index(query: str) -> Dict:
         return {"matches": []}
 
 
+def query_by_vector(vector: List[float]) -> Dict:
+    """
+    Query Pinecone index with a precomputed embedding
+
+    Args:
+        vector (List[float]): Query embedding
+
+    Returns:
+        dict: Query results
+    """
+    with metrics.time("query"):
+        return get_index().query(
+            vector=vector,
+            top_k=Config.TOP_K,
+            include_metadata=True
+        )
+
+
 def generate_response(query: str, matches: List[Dict]) -> str:
     """
     Generate a natural response based on query and matches with improved prompting
@@ -609,15 +984,17 @@ Guidelines:
 - Structure your response clearly with actionable steps when appropriate"""
 
     try:
-        response = client.chat.completions.create(
-            model=Config.LLM_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Query: {query}\n\nContext from documents:\n{context}"}
-            ],
-            temperature=Config.TEMPERATURE,
-            max_tokens=Config.MAX_RESPONSE_TOKENS
-        )
+        with metrics.time("generate"):
+            response = get_openai().chat.completions.create(
+                model=Config.LLM_MODEL,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": f"Query: {query}\n\nContext from documents:\n{context}"}
+                ],
+                temperature=Config.TEMPERATURE,
+                max_tokens=Config.MAX_RESPONSE_TOKENS
+            )
+        metrics.record_token_usage(response.usage, "generation")
 
         answer = response.choices[0].message.content
 
@@ -632,6 +1009,892 @@ Guidelines:
         return ("I encountered an error while generating a response. "
                 "Please try again or contact support if the problem persists.")
 
+# ------------------ Request coalescing ------------------
+
+
+class _InFlightCall:
+    """A computation shared by every caller waiting on the same key"""
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls that share the same key
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running block until it finishes and receive the same result
+    (or exception). Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _InFlightCall] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn once for all concurrent callers with the same key
+
+        Args:
+            key (str): Deduplication key
+            fn (Callable): Zero-argument function computing the result
+
+        Returns:
+            tuple: (result, shared) where shared is True if the result came
+                from another caller's in-flight computation
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                leader = False
+                self.shared += 1
+            else:
+                call = _InFlightCall()
+                self._calls[key] = call
+                leader = True
+                self.executed += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, False
+
+
+query_flight = SingleFlight()
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query for deduplication (case and whitespace insensitive)
+
+    Args:
+        query (str): Raw user query
+
+    Returns:
+        str: Normalized query
+    """
+    return " ".join(query.split()).lower()
+
+
+def answer_query(query: str) -> Tuple[List[Dict], str]:
+    """
+    Retrieve matches and generate a response, sharing the work between
+    concurrent identical queries
+
+    Args:
+        query (str): User query
+
+    Returns:
+        tuple: (matches, response)
+    """
+    def compute() -> Tuple[List[Dict], str]:
+        results = query_index(query)
+        matches = results.get("matches", [])
+        return matches, generate_response(query, matches)
+
+    (matches, response), shared = query_flight.do(normalize_query(query), compute)
+    if shared:
+        logger.info("Query coalesced with an in-flight identical request")
+        metrics.inc_cache_hit("query_coalescing")
+    return matches, response
+
+# ------------------ Conversation memory ------------------
+
+
+class ConversationTurn:
+    """A single question/answer exchange, truncated to a fixed size"""
+    __slots__ = ("query", "answer", "timestamp")
+
+    def __init__(self, query: str, answer: str, timestamp: Optional[float] = None):
+        self.query = query[:Config.HISTORY_MAX_TURN_CHARS]
+        self.answer = answer[:Config.HISTORY_MAX_TURN_CHARS]
+        self.timestamp = timestamp if timestamp is not None else time.time()
+
+    def to_dict(self) -> Dict:
+        return {"query": self.query, "answer": self.answer, "timestamp": self.timestamp}
+
+
+class ChatHistory:
+    """Recent turns of one chat plus a rolling summary of older ones"""
+    __slots__ = ("turns", "summary", "conversation_id")
+
+    def __init__(self, turns: Optional[List[ConversationTurn]] = None, summary: str = "",
+                 conversation_id: Optional[str] = None):
+        self.turns = deque(turns or [], maxlen=Config.HISTORY_MAX_TURNS)
+        self.summary = summary
+        # Changes whenever a chat starts over, so late writes for a cleared
+        # conversation can be told apart from the current one
+        self.conversation_id = conversation_id or os.urandom(8).hex()
+
+    def approx_size(self) -> int:
+        """Approximate memory footprint in bytes"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.turns) + sys.getsizeof(self.summary)
+        for turn in self.turns:
+            size += (sys.getsizeof(turn) + sys.getsizeof(turn.query)
+                     + sys.getsizeof(turn.answer) + sys.getsizeof(turn.timestamp))
+        return size
+
+
+class SQLiteConversationBackend:
+    """Local persistent storage for chat histories"""
+
+    def __init__(self, path: str):
+        # Autocommit mode; multi-statement updates use transaction()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False,
+                                     isolation_level=None)
+        # WAL lets several worker processes read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "chat_id INTEGER PRIMARY KEY, summary TEXT, turns TEXT, updated_at REAL, "
+            "conversation_id TEXT)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(conversations)")]
+        if "conversation_id" not in columns:
+            # Databases created before conversation IDs existed
+            with self.transaction():
+                self._conn.execute("ALTER TABLE conversations ADD COLUMN conversation_id TEXT")
+                self._conn.execute(
+                    "UPDATE conversations SET conversation_id = lower(hex(randomblob(8)))")
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Hold the database write lock so a load/modify/save is atomic across workers"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def load(self, chat_id: int) -> Optional[ChatHistory]:
+        row = self._conn.execute(
+            "SELECT summary, turns, conversation_id FROM conversations WHERE chat_id = ?",
+            (chat_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        turns = [ConversationTurn(t["query"], t["answer"], t["timestamp"])
+                 for t in json.loads(row[1])]
+        return ChatHistory(turns, row[0], row[2])
+
+    def save(self, chat_id: int, history: ChatHistory) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO conversations "
+            "(chat_id, summary, turns, updated_at, conversation_id) VALUES (?, ?, ?, ?, ?)",
+            (chat_id, history.summary, json.dumps([t.to_dict() for t in history.turns]),
+             time.time(), history.conversation_id)
+        )
+
+    def delete(self, chat_id: int) -> None:
+        self._conn.execute("DELETE FROM conversations WHERE chat_id = ?", (chat_id,))
+
+
+def summarize_turns(summary: str, turns: List[ConversationTurn]) -> str:
+    """
+    Fold older turns into the running conversation summary
+
+    Args:
+        summary (str): Existing summary (may be empty)
+        turns (List[ConversationTurn]): Turns leaving the recent window
+
+    Returns:
+        str: Updated summary, capped at HISTORY_MAX_SUMMARY_CHARS
+    """
+    transcript = "\n".join(f"User: {t.query}\nBot: {t.answer}" for t in turns)
+    try:
+        response = get_openai().chat.completions.create(
+            model=Config.LLM_MODEL,
+            messages=[
+                {"role": "system", "content": (
+                    "Update the summary of a coaching conversation. Keep the user's goals, "
+                    "topics discussed and key advice given. Reply with the summary only.")},
+                {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\n"
+                                            f"New exchanges:\n{transcript}"}
+            ],
+            temperature=0,
+            max_tokens=150
+        )
+        metrics.record_token_usage(response.usage, "summary")
+        new_summary = response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.error(f"Error summarizing conversation: {e}")
+        # Fall back to keeping the most recent questions verbatim
+        new_summary = " ".join([summary] + [t.query for t in turns]).strip()
+
+    return new_summary[-Config.HISTORY_MAX_SUMMARY_CHARS:]
+
+
+class ConversationStore:
+    """
+    Bounded per-chat conversation memory
+
+    Keeps at most HISTORY_MAX_CHATS chats in memory (least recently used are
+    evicted) and at most HISTORY_MAX_TURNS turns per chat; older turns are
+    rolled into a cached summary so prompt size stays constant.
+    """
+
+    def __init__(self, backend: Optional[SQLiteConversationBackend] = None):
+        self._lock = threading.Lock()
+        self._chats: "OrderedDict[int, ChatHistory]" = OrderedDict()
+        # Running total of approx_size() over _chats, so memory_usage() is O(1)
+        self._sizes: Dict[int, int] = {}
+        self._total_bytes = 0
+        self._backend = backend
+
+    def _get(self, chat_id: int) -> Optional[ChatHistory]:
+        if self._backend is not None:
+            # The backend is shared by all workers, so it is the source of truth
+            history = self._backend.load(chat_id)
+            if history is not None:
+                self._put(chat_id, history)
+            return history
+        history = self._chats.get(chat_id)
+        if history is not None:
+            self._chats.move_to_end(chat_id)
+        return history
+
+    def _put(self, chat_id: int, history: ChatHistory) -> None:
+        size = history.approx_size()
+        self._total_bytes += size - self._sizes.get(chat_id, 0)
+        self._sizes[chat_id] = size
+        self._chats[chat_id] = history
+        self._chats.move_to_end(chat_id)
+        while len(self._chats) > Config.HISTORY_MAX_CHATS:
+            evicted_id, _ = self._chats.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(evicted_id)
+
+    def get_context(self, chat_id: int) -> Tuple[str, List[ConversationTurn]]:
+        """
+        Get the summary and recent turns for a chat
+
+        Args:
+            chat_id (int): Telegram chat ID
+
+        Returns:
+            tuple: (summary, recent turns oldest first)
+        """
+        with self._lock:
+            history = self._get(chat_id)
+            if history is None:
+                return "", []
+            return history.summary, list(history.turns)
+
+    def _update(self, chat_id: int, fn: Callable[[ChatHistory], Any], create: bool = True) -> Any:
+        """
+        Atomically load, modify and save a chat's history
+
+        Args:
+            chat_id (int): Telegram chat ID
+            fn (Callable): Mutates the history in place and returns a result
+            create (bool): Start a new history if the chat has none; otherwise
+                leave the chat untouched and return None
+
+        Returns:
+            Any: Whatever fn returned
+        """
+        with self._lock:
+            if self._backend is None:
+                history = self._get(chat_id)
+                if history is None:
+                    if not create:
+                        return None
+                    history = ChatHistory()
+                result = fn(history)
+            else:
+                with self._backend.transaction():
+                    history = self._backend.load(chat_id)
+                    if history is None:
+                        if not create:
+                            return None
+                        history = ChatHistory()
+                    result = fn(history)
+                    self._backend.save(chat_id, history)
+            self._put(chat_id, history)
+            return result
+
+    def add_turn(self, chat_id: int, query: str, answer: str) -> None:
+        """
+        Record an exchange, summarizing the oldest turns when the window is full
+
+        Args:
+            chat_id (int): Telegram chat ID
+            query (str): User query
+            answer (str): Bot answer
+        """
+        def append(history: ChatHistory) -> Tuple[List[ConversationTurn], str, str]:
+            expired = []
+            if len(history.turns) == history.turns.maxlen:
+                batch = min(Config.HISTORY_SUMMARY_BATCH, len(history.turns))
+                expired = [history.turns.popleft() for _ in range(batch)]
+            history.turns.append(ConversationTurn(query, answer))
+            return expired, history.summary, history.conversation_id
+
+        # The expired turns are removed in the same atomic step, so no other
+        # caller (thread or worker) can summarize them a second time
+        expired, base_summary, conversation_id = self._update(chat_id, append)
+        if not expired:
+            return
+
+        while True:
+            # Summarize outside the lock so other chats aren't blocked on the LLM
+            summary = summarize_turns(base_summary, expired)
+
+            def store_summary(history: ChatHistory) -> Optional[str]:
+                if history.conversation_id != conversation_id:
+                    # Cleared (e.g. /start) while summarizing; drop the stale summary
+                    return None
+                if history.summary != base_summary:
+                    # Another caller rolled up other turns meanwhile; redo on top of theirs
+                    return history.summary
+                history.summary = summary
+                return None
+
+            # create=False so a chat cleared meanwhile isn't brought back
+            newer_summary = self._update(chat_id, store_summary, create=False)
+            if newer_summary is None:
+                return
+            base_summary = newer_summary
+
+    def clear(self, chat_id: int) -> None:
+        """
+        Forget the conversation for a chat
+
+        Args:
+            chat_id (int): Telegram chat ID
+        """
+        with self._lock:
+            self._chats.pop(chat_id, None)
+            self._total_bytes -= self._sizes.pop(chat_id, 0)
+            if self._backend is not None:
+                self._backend.delete(chat_id)
+
+    def memory_usage(self) -> Dict:
+        """
+        Report memory used by in-memory histories
+
+        Returns:
+            dict: Active chats, approximate total bytes and the per-chat cap
+        """
+        with self._lock:
+            total = self._total_bytes
+            active = len(self._chats)
+        return {
+            "active_chats": active,
+            "approx_bytes": total,
+            "max_chats": Config.HISTORY_MAX_CHATS,
+            "max_chars_per_chat": (Config.HISTORY_MAX_TURNS * 2 * Config.HISTORY_MAX_TURN_CHARS
+                                   + Config.HISTORY_MAX_SUMMARY_CHARS)
+        }
+
+
+def _conversation_db_file() -> Optional[str]:
+    """History database path; shared by default when running several workers"""
+    if Config.HISTORY_DB_FILE:
+        return Config.HISTORY_DB_FILE
+    if Config.WORKERS > 1:
+        os.makedirs(Config.SHARED_STATE_DIR, exist_ok=True)
+        return os.path.join(Config.SHARED_STATE_DIR, "conversations.db")
+    return None
+
+
+_history_db_file = _conversation_db_file()
+conversation_store = ConversationStore(
+    SQLiteConversationBackend(_history_db_file) if _history_db_file else None
+)
+
+
+def rewrite_followup_query(query: str, summary: str, turns: List[ConversationTurn]) -> str:
+    """
+    Rewrite a follow-up question into a standalone search query using history
+
+    Args:
+        query (str): Latest user message
+        summary (str): Summary of older turns
+        turns (List[ConversationTurn]): Recent turns, oldest first
+
+    Returns:
+        str: Standalone query (the original query if there is no history)
+    """
+    if not summary and not turns:
+        return query
+
+    history = "\n".join(f"User: {t.query}\nBot: {t.answer}" for t in turns)
+    try:
+        response = get_openai().chat.completions.create(
+            model=Config.LLM_MODEL,
+            messages=[
+                {"role": "system", "content": (
+                    "Rewrite the user's latest message as a standalone search query, "
+                    "resolving references to the earlier conversation. If it is already "
+                    "standalone, return it unchanged. Reply with the query only.")},
+                {"role": "user", "content": f"Conversation summary:\n{summary or '(none)'}\n\n"
+                                            f"Recent messages:\n{history}\n\n"
+                                            f"Latest message: {query}"}
+            ],
+            temperature=0,
+            max_tokens=100
+        )
+        metrics.record_token_usage(response.usage, "rewrite")
+        rewritten = response.choices[0].message.content.strip()
+        return rewritten[:Config.MAX_QUERY_LENGTH] or query
+    except Exception as e:
+        logger.error(f"Error rewriting follow-up query: {e}")
+        return query
+
+# ------------------ Batch search ------------------
+
+
+def _serialize_match(match) -> Dict:
+    """Convert a Pinecone match (dict or model object) to plain JSON data"""
+    return {
+        "id": match.get("id"),
+        "score": match.get("score"),
+        "metadata": match.get("metadata", {})
+    }
+
+
+async def search_batch(queries: List[str], generate: bool = False,
+                       concurrency: int = Config.BATCH_QUERY_CONCURRENCY) -> AsyncIterator[Dict]:
+    """
+    Search many queries at once, yielding each result as soon as it is ready
+
+    Queries are embedded in batched API calls (duplicates embedded once);
+    the next batch is embedded while the current one's vector queries and
+    optional generation run concurrently.
+
+    Args:
+        queries (List[str]): Search queries
+        generate (bool): Also generate a response for each query
+        concurrency (int): Maximum concurrent vector queries / generations
+
+    Yields:
+        dict: Result with the query's position in the input as "index"
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def search_one(position: int, query: str, vector: List[float]) -> Dict:
+        async with semaphore:
+            try:
+                results = await asyncio.to_thread(query_by_vector, vector)
+                matches = results.get("matches", [])
+                item = {
+                    "index": position,
+                    "query": query,
+                    "matches_found": len(matches),
+                    "matches": [_serialize_match(m) for m in matches]
+                }
+                if generate:
+                    item["response"] = await asyncio.to_thread(generate_response, query, matches)
+                return item
+            except Exception as e:
+                logger.error(f"Error in batch search for query {position}: {e}")
+                return {"index": position, "query": query, "error": "search_failed"}
+
+    async def embed_batch(start: int) -> Optional[Dict[str, List[float]]]:
+        unique_texts = list(dict.fromkeys(queries[start:start + Config.EMBEDDING_BATCH_SIZE]))
+        try:
+            vectors = await asyncio.to_thread(embed_texts, unique_texts)
+        except Exception:
+            return None
+        return dict(zip(unique_texts, vectors))
+
+    starts = range(0, len(queries), Config.EMBEDDING_BATCH_SIZE)
+    pending_embedding = asyncio.create_task(embed_batch(0)) if starts else None
+    tasks: List[asyncio.Task] = []
+    try:
+        for start in starts:
+            vector_by_text = await pending_embedding
+            # Prefetch the next batch's embeddings while this batch is searched
+            next_start = start + Config.EMBEDDING_BATCH_SIZE
+            pending_embedding = (asyncio.create_task(embed_batch(next_start))
+                                 if next_start < len(queries) else None)
+
+            batch = queries[start:start + Config.EMBEDDING_BATCH_SIZE]
+            if vector_by_text is None:
+                for offset, query in enumerate(batch):
+                    yield {"index": start + offset, "query": query, "error": "embedding_failed"}
+                continue
+
+            tasks = [
+                asyncio.create_task(search_one(start + offset, query, vector_by_text[query]))
+                for offset, query in enumerate(batch)
+            ]
+            for task in asyncio.as_completed(tasks):
+                yield await task
+    finally:
+        # Stop work nobody will read if the consumer went away early
+        for task in tasks:
+            task.cancel()
+        if pending_embedding is not None:
+            pending_embedding.cancel()
+
+
+def run_search_batch(queries: List[str], generate: bool = False,
+                     concurrency: int = Config.BATCH_QUERY_CONCURRENCY) -> List[Dict]:
+    """
+    Synchronous wrapper around search_batch for offline evaluation scripts
+
+    Args:
+        queries (List[str]): Search queries
+        generate (bool): Also generate a response for each query
+        concurrency (int): Maximum concurrent vector queries / generations
+
+    Returns:
+        List[Dict]: Results in input order
+    """
+    async def collect() -> List[Dict]:
+        return [item async for item in search_batch(queries, generate, concurrency)]
+
+    return sorted(asyncio.run(collect()), key=lambda item: item["index"])
+
+# ------------------ Multi-worker coordination ------------------
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, fall back to single-process behaviour
+    fcntl = None
+
+
+def shared_state_path(name: str) -> str:
+    """
+    Get the path of a file in the directory shared by all workers
+
+    Args:
+        name (str): File name
+
+    Returns:
+        str: Path inside Config.SHARED_STATE_DIR
+    """
+    os.makedirs(Config.SHARED_STATE_DIR, exist_ok=True)
+    return os.path.join(Config.SHARED_STATE_DIR, name)
+
+
+def write_shared_state(name: str, data: Dict) -> None:
+    """
+    Atomically write JSON state visible to all workers
+
+    Args:
+        name (str): State file name
+        data (dict): JSON-serializable state
+    """
+    try:
+        path = shared_state_path(name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error(f"Error writing shared state {name}: {e}")
+
+
+def read_shared_state(name: str) -> Optional[Dict]:
+    """
+    Read JSON state written by any worker
+
+    Args:
+        name (str): State file name
+
+    Returns:
+        dict: State, or None if it doesn't exist yet
+    """
+    try:
+        with open(shared_state_path(name), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Error reading shared state {name}: {e}")
+        return None
+
+
+class FileLock:
+    """
+    Inter-process lock backed by flock on a local file
+
+    The OS releases the lock when the holding process exits, so a crashed
+    worker never leaves a stale lock behind.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._fd = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Acquire the lock
+
+        Args:
+            blocking (bool): Wait for the lock instead of failing immediately
+
+        Returns:
+            bool: True if the lock is now held by this process
+        """
+        if self._fd is not None:
+            return True
+
+        fd = os.open(shared_state_path(self.name), os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(fd, flags)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+
+        # Record the holder for debugging
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+# Held for the lifetime of the worker that performs ingestion and status refreshes
+leader_lease = FileLock("leader.lock")
+# Whether ingestion has succeeded since this worker acquired the lease
+leader_state: Dict[str, bool] = {"ingested": False}
+
+
+async def run_locked_ingestion(docs_path: str = Config.DOCS_FOLDER) -> None:
+    """
+    Run ingest_documents while holding the lock that guards file_hashes.json
+
+    Args:
+        docs_path (str): Path to documents folder
+    """
+    hashes_lock = FileLock("hashes.lock")
+    await asyncio.to_thread(hashes_lock.acquire)
+    try:
+        await ingest_documents(docs_path)
+    finally:
+        hashes_lock.release()
+
+
+async def try_become_leader() -> bool:
+    """
+    Try to take the leader lease; a new leader runs ingestion and cleanup
+
+    Ingestion is retried on every call until it succeeds, and runs on its
+    own event loop in a worker thread because it makes blocking API calls
+    that would otherwise stall requests served by this worker.
+
+    Returns:
+        bool: True if this worker is the leader
+
+    Raises:
+        Exception: If ingestion failed (the lease is kept and it is retried)
+    """
+    if not leader_lease.held:
+        if not leader_lease.acquire(blocking=False):
+            return False
+        leader_state["ingested"] = False
+        logger.info(f"Worker {os.getpid()} is the ingestion leader")
+
+    if not leader_state["ingested"]:
+        await asyncio.to_thread(asyncio.run, run_locked_ingestion())
+        leader_state["ingested"] = True
+    return True
+
+# Unique per worker process, even if a pid is reused after a restart
+_worker_started_at = time.time()
+
+
+def worker_id() -> str:
+    return f"{os.getpid()}-{int(_worker_started_at * 1000)}"
+
+
+def publish_worker_state() -> None:
+    """Write this worker's metrics and local counters for the other workers to merge"""
+    write_shared_state(f"worker-{worker_id()}.json", {
+        "pid": os.getpid(),
+        "updated_at": time.time(),
+        "metrics": metrics.export_state() if metrics.enabled else None,
+        "query_coalescing": {"executed": query_flight.executed, "shared": query_flight.shared},
+        "conversations": conversation_store.memory_usage()
+    })
+
+
+def read_worker_states() -> List[Dict]:
+    """
+    Read the state published by every worker, including ones that have exited
+
+    Returns:
+        List[Dict]: Published worker states
+    """
+    try:
+        names = os.listdir(Config.SHARED_STATE_DIR)
+    except FileNotFoundError:
+        return []
+    states = []
+    for name in names:
+        if name.startswith("worker-") and name.endswith(".json"):
+            state = read_shared_state(name)
+            if state is not None:
+                states.append(state)
+    return states
+
+
+def aggregate_worker_states(states: List[Dict]) -> Dict:
+    """
+    Combine per-worker counters into totals for /stats
+
+    Counters are summed over all workers (exited ones included, so totals
+    never go backwards); memory gauges only over workers that published
+    recently.
+
+    Args:
+        states (List[Dict]): Published worker states
+
+    Returns:
+        dict: Aggregated query coalescing and conversation figures
+    """
+    now = time.time()
+    limits = conversation_store.memory_usage()
+    live = [s for s in states if now - s["updated_at"] <= Config.STATUS_MAX_STALENESS]
+    return {
+        "workers": len(live),
+        "query_coalescing": {
+            "executed": sum(s["query_coalescing"]["executed"] for s in states),
+            "shared": sum(s["query_coalescing"]["shared"] for s in states)
+        },
+        "conversations": {
+            "active_chats": sum(s["conversations"]["active_chats"] for s in live),
+            "approx_bytes": sum(s["conversations"]["approx_bytes"] for s in live),
+            "max_chats_per_worker": limits["max_chats"],
+            "max_chars_per_chat": limits["max_chars_per_chat"]
+        }
+    }
+
+# ------------------ Health and stats snapshot ------------------
+
+
+class StatusCache:
+    """
+    Cached health and stats snapshot kept fresh by a background task
+
+    Endpoints read the snapshot instead of calling Pinecone or re-reading
+    file_hashes.json on every request. Only the leader worker queries
+    Pinecone; it publishes the snapshot to shared state for the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Dict] = None
+        self._updated_at: Optional[float] = None
+
+    def refresh(self) -> None:
+        """Rebuild the snapshot (leader) or load the leader's published one"""
+        if not leader_lease.held:
+            shared = read_shared_state("status.json")
+            if shared is not None:
+                with self._lock:
+                    self._snapshot = shared["snapshot"]
+                    self._updated_at = shared["updated_at"]
+            return
+
+        health = {"status": "healthy", "pinecone": "connected"}
+        try:
+            get_pinecone().list_indexes()
+            stats = get_index().describe_index_stats()
+            index_stats = {
+                "total_vectors": stats.get('total_vector_count', 0),
+                "index_fullness": stats.get('index_fullness', 0),
+                "dimension": stats.get('dimension', 0),
+                "updated_at": time.time()
+            }
+        except Exception as e:
+            logger.error(f"Status refresh failed: {e}")
+            health = {"status": "unhealthy", "pinecone": "unavailable"}
+            # Keep the last good index stats rather than reporting an empty index
+            previous = self._snapshot
+            if previous is None:
+                shared = read_shared_state("status.json")
+                previous = shared["snapshot"] if shared else None
+            index_stats = previous["index"] if previous else {}
+
+        current_hashes = load_file_hashes()
+        snapshot = {
+            "health": health,
+            "index": index_stats,
+            "tracked_files": len(current_hashes),
+            "files": list(current_hashes.keys()),
+            "ingestion": dict(ingestion_stats),
+            "workers": aggregate_worker_states(read_worker_states())
+        }
+        updated_at = time.time()
+        with self._lock:
+            self._snapshot = snapshot
+            self._updated_at = updated_at
+        write_shared_state("status.json", {"snapshot": snapshot, "updated_at": updated_at})
+
+    def get(self) -> Tuple[Optional[Dict], Optional[float]]:
+        """
+        Get the latest snapshot and its age
+
+        Returns:
+            tuple: (snapshot, age in seconds), both None before the first refresh
+        """
+        with self._lock:
+            if self._snapshot is None:
+                return None, None
+            return self._snapshot, time.time() - self._updated_at
+
+    def is_fresh(self) -> bool:
+        """True if a healthy snapshot exists and is within STATUS_MAX_STALENESS"""
+        snapshot, age = self.get()
+        return (snapshot is not None and age <= Config.STATUS_MAX_STALENESS
+                and snapshot["health"]["status"] == "healthy")
+
+
+status_cache = StatusCache()
+
+
+async def refresh_status_periodically() -> None:
+    """
+    Refresh the status snapshot every STATUS_REFRESH_INTERVAL seconds and
+    take over as leader if the previous leader worker exited
+    """
+    while True:
+        await asyncio.sleep(Config.STATUS_REFRESH_INTERVAL)
+        try:
+            await try_become_leader()
+            await asyncio.to_thread(publish_worker_state)
+            await asyncio.to_thread(status_cache.refresh)
+        except Exception as e:
+            logger.error(f"Error refreshing status snapshot: {e}")
+
 # ------------------ FastAPI endpoints ------------------
 
 
@@ -644,9 +1907,13 @@ def root():
         "status": "healthy",
         "endpoints": {
             "search": "/search?q=your_question",
+            "search_batch": "/search/batch",
             "telegram_webhook": "/telegram-webhook",
             "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
             "stats": "/stats",
+            "metrics": "/metrics",
             "cleanup": "/cleanup"
         }
     }
@@ -654,40 +1921,72 @@ def root():
 
 @app.get("/health")
 def health_check():
-    """Health check endpoint for monitoring"""
-    try:
-        # Quick test of Pinecone connection
-        pc.list_indexes()
-        return {"status": "healthy", "pinecone": "connected"}
-    except Exception as e:
-        logger.error(f"Health check failed: {e}")
+    """Health check endpoint for monitoring (served from the cached snapshot)"""
+    snapshot, age = status_cache.get()
+    if snapshot is None or not status_cache.is_fresh():
         raise HTTPException(status_code=503, detail="Service unavailable")
+    return {**snapshot["health"], "age_seconds": round(age, 1)}
+
+
+@app.get("/health/live")
+def liveness_check():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def readiness_check():
+    """Readiness probe: startup finished and the cached snapshot is healthy"""
+    if not app_state["ready"] or not status_cache.is_fresh():
+        raise HTTPException(status_code=503, detail="Not ready")
+    return {"status": "ready"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Expose pipeline metrics in Prometheus text format"""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    # Sum every worker's published metrics so scrapes through a load
+    # balancer see the same totals whichever worker answers
+    publish_worker_state()
+    states = [state["metrics"] for state in read_worker_states() if state.get("metrics")]
+    return PlainTextResponse(metrics.render(states), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/stats")
 def get_index_stats():
     """
-    Get current Pinecone index statistics
+    Get Pinecone index statistics from the cached snapshot plus local counters
     """
-    try:
-        index = pc.Index(Config.INDEX_NAME)
-        stats = index.describe_index_stats()
-
-        # Get file information
-        current_hashes = load_file_hashes()
-
-        return {
-            "index_name": Config.INDEX_NAME,
-            "total_vectors": stats.get('total_vector_count', 0),
-            "index_fullness": stats.get('index_fullness', 0),
-            "dimension": stats.get('dimension', 0),
-            "tracked_files": len(current_hashes),
-            "files": list(current_hashes.keys()) if current_hashes else []
-        }
-    except Exception as e:
-        logger.error(f"Error getting index stats: {e}")
+    snapshot, age = status_cache.get()
+    if snapshot is None or not snapshot["index"]:
+        # No successful Pinecone read yet; don't report an empty index
         raise HTTPException(
-            status_code=500, detail="Failed to get index stats")
+            status_code=503, detail="Index stats not available yet")
+
+    index_stats = snapshot["index"]
+    ingestion = snapshot.get("ingestion", {})
+    # Totals over all workers, as of the last snapshot refresh
+    workers = snapshot.get("workers") or aggregate_worker_states([])
+    return {
+        "index_name": Config.INDEX_NAME,
+        "health": snapshot["health"]["status"],
+        "total_vectors": index_stats.get("total_vectors", 0),
+        "index_fullness": index_stats.get("index_fullness", 0),
+        "dimension": index_stats.get("dimension", 0),
+        "index_stats_age_seconds": round(time.time() - index_stats.get("updated_at", 0), 1),
+        "tracked_files": snapshot["tracked_files"],
+        "files": snapshot["files"],
+        "snapshot_age_seconds": round(age, 1),
+        "ingestion": ingestion,
+        "workers": workers["workers"],
+        "caches": {
+            "query_coalescing": workers["query_coalescing"],
+            "file_hash_hits": ingestion.get("unchanged_files", 0)
+        },
+        "conversations": workers["conversations"]
+    }
 
 
 @app.post("/cleanup")
@@ -696,7 +1995,13 @@ async def manual_cleanup():
     Manually trigger cleanup of deleted files
     """
     try:
-        await cleanup_deleted_files()
+        hashes_lock = FileLock("hashes.lock")
+        await asyncio.to_thread(hashes_lock.acquire)
+        try:
+            await cleanup_deleted_files()
+        finally:
+            hashes_lock.release()
+        await asyncio.to_thread(status_cache.refresh)
         return {"status": "cleanup_completed", "message": "Successfully cleaned up vectors for deleted files"}
     except Exception as e:
         logger.error(f"Manual cleanup failed: {e}")
@@ -730,15 +2035,14 @@ def search(q: str):
         )
 
     try:
-        results = query_index(query)
-        matches = results.get("matches", [])
+        matches, response = answer_query(query)
 
         # Enhanced response format
         return {
             "query": query,
             "matches_found": len(matches),
             "matches": matches,
-            "response": generate_response(query, matches)
+            "response": response
         }
 
     except Exception as e:
@@ -749,6 +2053,137 @@ def search(q: str):
         )
 
 
+async def handle_telegram_update(data: Dict) -> Dict:
+    """
+    Process a single Telegram update (shared by webhook and long polling)
+
+    Args:
+        data (dict): Telegram update object
+
+    Returns:
+        dict: Processing status
+    """
+    # Validate message structure
+    if not data.get("message"):
+        return {"status": "no_message"}
+
+    message = data["message"]
+
+    if not message.get("text"):
+        return {"status": "no_text_message"}
+
+    query = message["text"].strip()
+    chat_id = message["chat"]["id"]
+    user_info = message.get("from", {})
+    username = user_info.get("username", "unknown")
+
+    logger.info(
+        f"Received message from @{username} (chat_id: {chat_id}): {query[:100]}...")
+
+    # Validate query length
+    if len(query) > Config.MAX_QUERY_LENGTH:
+        response = (f"Your message is too long ({len(query)} characters). "
+                    f"Please keep it under {Config.MAX_QUERY_LENGTH} characters.")
+        await send_telegram_message(chat_id, response)
+        return {"status": "query_too_long"}
+
+    # Handle commands
+    if query.startswith('/'):
+        if query == '/start':
+            await asyncio.to_thread(conversation_store.clear, chat_id)
+            response = ("Welcome to the Enhanced Coaching Bot!\n\n"
+                        "I can help answer questions based on your uploaded documents. "
+                        "Just send me your question and I'll search through the knowledge base.")
+        elif query == '/help':
+            response = ("*How to use this bot:*\n\n"
+                        "• Simply type your question\n"
+                        "• I'll search through uploaded documents\n"
+                        "• Ask follow-up questions anytime\n"
+                        "• Use /start to see this welcome message again and start a new conversation")
+        else:
+            response = "Unknown command. Type /help for available commands."
+
+        await send_telegram_message(chat_id, response)
+        return {"status": "command_processed"}
+
+    # Process regular query
+    try:
+        # Resolve follow-ups against the chat history before retrieval
+        summary, turns = await asyncio.to_thread(conversation_store.get_context, chat_id)
+        search_query = await asyncio.to_thread(rewrite_followup_query, query, summary, turns)
+        if search_query != query:
+            logger.info(f"Rewrote follow-up query: {search_query[:100]}")
+
+        # Run the blocking pipeline off the event loop so concurrent
+        # identical queries can be coalesced
+        _, response = await asyncio.to_thread(answer_query, search_query)
+
+        success = await send_telegram_message(chat_id, response)
+
+        if success:
+            await asyncio.to_thread(conversation_store.add_turn, chat_id, query, response)
+            logger.info(f"Successfully processed query for @{username}")
+            return {"status": "processed"}
+        else:
+            logger.error(f"Failed to send response to @{username}")
+            return {"status": "send_failed"}
+
+    except Exception as e:
+        logger.error(f"Error processing query for @{username}: {e}")
+        error_response = ("I encountered an error while processing your request. "
+                          "Please try rephrasing your question or try again later.")
+        await send_telegram_message(chat_id, error_response)
+        return {"status": "processing_error"}
+
+
+@app.post("/search/batch")
+async def search_batch_endpoint(request: Request):
+    """
+    Search many queries in one request, streaming results as NDJSON
+
+    Body: {"queries": ["...", ...], "generate": false}. Each output line is
+    one result carrying the query's input position as "index"; lines arrive
+    in completion order.
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Request body must be JSON")
+
+    queries = data.get("queries") if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not queries:
+        raise HTTPException(
+            status_code=400, detail="'queries' must be a non-empty list of strings")
+    if len(queries) > Config.MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many queries. Maximum is {Config.MAX_BATCH_QUERIES} per request"
+        )
+
+    cleaned = []
+    for position, query in enumerate(queries):
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPException(
+                status_code=400, detail=f"Query {position} must be a non-empty string")
+        if len(query.strip()) > Config.MAX_QUERY_LENGTH:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Query {position} too long. Maximum length is {Config.MAX_QUERY_LENGTH} characters"
+            )
+        cleaned.append(query.strip())
+
+    generate = data.get("generate", False)
+    if not isinstance(generate, bool):
+        raise HTTPException(status_code=400, detail="'generate' must be true or false")
+    logger.info(f"Batch search: {len(cleaned)} queries, generate={generate}")
+
+    async def ndjson() -> AsyncIterator[str]:
+        async for item in search_batch(cleaned, generate):
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
 @app.post("/telegram-webhook")
 async def telegram_webhook(request: Request):
     """
@@ -762,76 +2197,176 @@ async def telegram_webhook(request: Request):
     """
     try:
         data = await request.json()
+        return await handle_telegram_update(data)
 
-        # Validate message structure
-        if not data.get("message"):
-            return {"status": "no_message"}
+    except Exception as e:
+        logger.error(f"Error in telegram_webhook: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
 
-        message = data["message"]
+# ------------------ Telegram long polling ------------------
 
-        if not message.get("text"):
-            return {"status": "no_text_message"}
 
-        query = message["text"].strip()
-        chat_id = message["chat"]["id"]
-        user_info = message.get("from", {})
-        username = user_info.get("username", "unknown")
+def load_telegram_offset() -> int:
+    """
+    Load the next getUpdates offset from the offset file
 
-        logger.info(
-            f"Received message from @{username} (chat_id: {chat_id}): {query[:100]}...")
-
-        # Validate query length
-        if len(query) > Config.MAX_QUERY_LENGTH:
-            response = (f"Your message is too long ({len(query)} characters). "
-                        f"Please keep it under {Config.MAX_QUERY_LENGTH} characters.")
-            await send_telegram_message(chat_id, response)
-            return {"status": "query_too_long"}
-
-        # Handle commands
-        if query.startswith('/'):
-            if query == '/start':
-                response = ("Welcome to the Enhanced Coaching Bot!\n\n"
-                            "I can help answer questions based on your uploaded documents. "
-                            "Just send me your question and I'll search through the knowledge base.")
-            elif query == '/help':
-                response = ("*How to use this bot:*\n\n"
-                            "• Simply type your question\n"
-                            "• I'll search through uploaded documents\n"
-                            "• Ask follow-up questions anytime\n"
-                            "• Use /start to see this welcome message again")
-            else:
-                response = "Unknown command. Type /help for available commands."
+    Returns:
+        int: Offset of the first unprocessed update (0 if none stored)
+    """
+    try:
+        with open(Config.TELEGRAM_OFFSET_FILE, "r") as f:
+            return int(json.load(f).get("offset", 0))
+    except FileNotFoundError:
+        return 0
+    except Exception as e:
+        logger.error(f"Error loading Telegram offset: {e}")
+        return 0
 
-            await send_telegram_message(chat_id, response)
-            return {"status": "command_processed"}
 
-        # Process regular query
-        try:
-            results = query_index(query)
-            response = generate_response(query, results.get("matches", []))
+def save_telegram_offset(offset: int) -> None:
+    """
+    Persist the next getUpdates offset so restarts don't replay updates
+
+    Args:
+        offset (int): Offset of the first unprocessed update
+    """
+    try:
+        tmp_path = f"{Config.TELEGRAM_OFFSET_FILE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"offset": offset}, f)
+        os.replace(tmp_path, Config.TELEGRAM_OFFSET_FILE)
+    except Exception as e:
+        logger.error(f"Error saving Telegram offset: {e}")
 
-            success = await send_telegram_message(chat_id, response)
 
-            if success:
-                logger.info(f"Successfully processed query for @{username}")
-                return {"status": "processed"}
-            else:
-                logger.error(f"Failed to send response to @{username}")
-                return {"status": "send_failed"}
+class TelegramPollError(Exception):
+    """getUpdates returned an error response"""
 
-        except Exception as e:
-            logger.error(f"Error processing query for @{username}: {e}")
-            error_response = ("I encountered an error while processing your request. "
-                              "Please try rephrasing your question or try again later.")
-            await send_telegram_message(chat_id, error_response)
-            return {"status": "processing_error"}
+    def __init__(self, status: int, description: str, retry_after: Optional[float] = None):
+        super().__init__(f"getUpdates failed: {status} {description}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+async def fetch_telegram_updates(session: "aiohttp.ClientSession", offset: int) -> List[Dict]:
+    """
+    Fetch a batch of updates using getUpdates long polling
+
+    Args:
+        session (aiohttp.ClientSession): Session reused across polls
+        offset (int): Offset of the first update to return
+
+    Returns:
+        List[Dict]: Telegram update objects (empty if the long poll timed out)
+
+    Raises:
+        TelegramPollError: If Telegram returned an error response
+    """
+    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getUpdates"
+    payload = {
+        "offset": offset,
+        "limit": Config.TELEGRAM_POLL_LIMIT,
+        "timeout": Config.TELEGRAM_POLL_TIMEOUT,
+        "allowed_updates": ["message"]
+    }
+    import aiohttp
+
+    # Leave headroom over the server-side long poll timeout
+    timeout = aiohttp.ClientTimeout(total=Config.TELEGRAM_POLL_TIMEOUT + 10)
+
+    async with session.post(url, json=payload, timeout=timeout) as response:
+        if response.status != 200:
+            try:
+                data = await response.json(content_type=None)
+            except Exception:
+                data = {}
+            raise TelegramPollError(
+                response.status,
+                data.get("description", ""),
+                (data.get("parameters") or {}).get("retry_after")
+            )
+        data = await response.json()
+        return data.get("result", [])
 
+
+async def _handle_polled_update(update: Dict, slots: asyncio.Semaphore) -> None:
+    """Handle one polled update in the background, freeing its slot when done"""
+    try:
+        await handle_telegram_update(update)
     except Exception as e:
-        logger.error(f"Error in telegram_webhook: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+        logger.error(f"Error handling update {update.get('update_id')}: {e}")
+    finally:
+        slots.release()
+
+
+async def run_telegram_polling() -> None:
+    """
+    Receive Telegram messages with getUpdates long polling instead of the webhook
+    """
+    import aiohttp
+
+    offset = load_telegram_offset()
+    backoff = Config.TELEGRAM_POLL_BACKOFF
+    # Updates are handled as background tasks so a slow answer (or the
+    # summary roll-up after it) doesn't hold up the next getUpdates; the
+    # semaphore pauses polling once too many are in flight
+    slots = asyncio.Semaphore(Config.TELEGRAM_MAX_IN_FLIGHT)
+    in_flight = set()
+    logger.info(f"Starting Telegram long polling from offset {offset}")
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    updates = await fetch_telegram_updates(session, offset)
+                except TelegramPollError as e:
+                    if e.status == 409:
+                        # Retrying can't succeed until the webhook is removed
+                        logger.error(
+                            "getUpdates conflicts with an active webhook; remove it with "
+                            "deleteWebhook. Stopping long polling.")
+                        return
+                    delay = e.retry_after if e.retry_after else backoff
+                    logger.error(f"{e}; retrying in {delay}s")
+                    metrics.inc_retry("telegram_poll")
+                    await asyncio.sleep(delay)
+                    backoff = min(backoff * 2, Config.TELEGRAM_POLL_MAX_BACKOFF)
+                    continue
+                except Exception as e:
+                    logger.error(f"Error polling Telegram updates: {e}; retrying in {backoff}s")
+                    metrics.inc_retry("telegram_poll")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, Config.TELEGRAM_POLL_MAX_BACKOFF)
+                    continue
+
+                backoff = Config.TELEGRAM_POLL_BACKOFF
+
+                if not updates:
+                    continue
+
+                logger.info(f"Received batch of {len(updates)} updates")
+                for update in updates:
+                    await slots.acquire()
+                    task = asyncio.create_task(_handle_polled_update(update, slots))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+
+                # The next getUpdates confirms this batch to Telegram, so only move
+                # the offset once every update in it has been handed off
+                offset = max(update["update_id"] for update in updates) + 1
+                save_telegram_offset(offset)
+                await asyncio.to_thread(publish_worker_state)
+    finally:
+        # Confirmed updates are only in memory, so finish them before exiting
+        if in_flight:
+            logger.info(f"Waiting for {len(in_flight)} Telegram updates to finish")
+            await asyncio.gather(*in_flight, return_exceptions=True)
 
 # ------------------ Startup event ------------------
 
+# Background tasks and readiness flag owned by the startup/shutdown events
+app_state: Dict[str, Any] = {"ready": False, "status_task": None}
+
 
 @app.on_event("startup")
 async def startup_event():
@@ -842,16 +2377,63 @@ async def startup_event():
     logger.info(f"Configuration: {Config.INDEX_NAME}, {Config.DOCS_FOLDER}")
 
     try:
-        await ingest_documents()
+        validate_environment()
+        # Only one worker ingests; the others serve requests right away and
+        # pick up the leader's status snapshot from shared state
+        if not await try_become_leader():
+            logger.info(f"Worker {os.getpid()} is a follower, skipping ingestion")
+        await asyncio.to_thread(publish_worker_state)
+        await asyncio.to_thread(status_cache.refresh)
+        app_state["status_task"] = asyncio.create_task(refresh_status_periodically())
+        app_state["ready"] = True
         logger.info("Bot initialization completed successfully!")
     except Exception as e:
         logger.error(f"Failed to initialize bot: {e}")
         raise
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Stop background tasks
+    """
+    app_state["ready"] = False
+    task = app_state["status_task"]
+    if task is not None:
+        task.cancel()
+    # Keep this worker's counters in the merged totals after it exits
+    await asyncio.to_thread(publish_worker_state)
+    leader_lease.release()
+    leader_state["ingested"] = False
+
 # ------------------ Manual execution ------------------
 
+async def run_polling_mode() -> None:
+    """Ingest documents, then serve Telegram through long polling"""
+    validate_environment()
+    if await try_become_leader():
+        # The poller doesn't refresh the shared status snapshot, so hand the
+        # lease back for web workers to take over once ingestion is done
+        leader_lease.release()
+        leader_state["ingested"] = False
+    else:
+        logger.info("Another process is the ingestion leader, skipping ingestion")
+    await run_telegram_polling()
+
+
 if __name__ == "__main__":
     """Run ingestion manually if script is executed directly"""
-    logger.info("Running manual document ingestion...")
-    asyncio.run(ingest_documents())
-    logger.info("Manual ingestion completed!")
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Enhanced Coaching Bot")
+    parser.add_argument("--poll", action="store_true",
+                        help="serve Telegram via getUpdates long polling instead of the webhook")
+    args = parser.parse_args()
+
+    if args.poll:
+        logger.info("Running Telegram long polling mode...")
+        asyncio.run(run_polling_mode())
+    else:
+        logger.info("Running manual document ingestion...")
+        asyncio.run(run_locked_ingestion())
+        logger.info("Manual ingestion completed!")
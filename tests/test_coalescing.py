@@ -0,0 +1,60 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import main
+
+
+class QueryCoalescingTest(unittest.TestCase):
+    """Concurrent identical queries share one upstream computation"""
+
+    def test_concurrent_identical_queries_call_upstream_once(self):
+        calls = {"query_index": 0, "generate_response": 0}
+        calls_lock = threading.Lock()
+
+        def fake_query_index(query):
+            with calls_lock:
+                calls["query_index"] += 1
+            # Keep the computation in flight while the other threads arrive
+            time.sleep(0.2)
+            return {"matches": [{"metadata": {"text": "Drink water.", "source": "tips.txt"}}]}
+
+        def fake_generate_response(query, matches):
+            with calls_lock:
+                calls["generate_response"] += 1
+            return "Drink water instead of sugary drinks."
+
+        variants = ["How to sleep better?", "  how TO sleep   better? ", "HOW to Sleep better?"]
+        results = []
+        results_lock = threading.Lock()
+
+        def ask(query):
+            answer = main.answer_query(query)
+            with results_lock:
+                results.append(answer)
+
+        with mock.patch.object(main, "query_index", fake_query_index), \
+                mock.patch.object(main, "generate_response", fake_generate_response):
+            threads = [threading.Thread(target=ask, args=(variants[i % len(variants)],))
+                       for i in range(12)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(calls, {"query_index": 1, "generate_response": 1})
+        self.assertEqual(len(results), 12)
+        self.assertTrue(all(result == results[0] for result in results))
+
+    def test_different_queries_are_not_coalesced(self):
+        with mock.patch.object(main, "query_index", return_value={"matches": []}) as query_index, \
+                mock.patch.object(main, "generate_response", return_value="answer"):
+            main.answer_query("first question")
+            main.answer_query("second question")
+
+        self.assertEqual(query_index.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import main
+
+
+def fake_summarize(summary, turns):
+    return " ".join([summary] + [turn.query for turn in turns]).strip()
+
+
+class ConversationStoreTest(unittest.TestCase):
+    """Bounded per-chat memory in the default in-memory mode"""
+
+    def make_store(self):
+        return main.ConversationStore()
+
+    def test_least_recently_used_chats_are_evicted(self):
+        store = self.make_store()
+        with mock.patch.object(main.Config, "HISTORY_MAX_CHATS", 2):
+            store.add_turn(1, "q1", "a1")
+            store.add_turn(2, "q2", "a2")
+            store.get_context(1)  # chat 1 becomes most recently used
+            store.add_turn(3, "q3", "a3")
+
+        self.assertEqual(store.memory_usage()["active_chats"], 2)
+        self.assertEqual(store.get_context(2), ("", []))
+        self.assertEqual([t.query for t in store.get_context(1)[1]], ["q1"])
+        self.assertEqual([t.query for t in store.get_context(3)[1]], ["q3"])
+
+    def test_turns_are_truncated(self):
+        store = self.make_store()
+        store.add_turn(1, "q" * 10000, "a" * 10000)
+
+        turn = store.get_context(1)[1][0]
+        self.assertEqual(len(turn.query), main.Config.HISTORY_MAX_TURN_CHARS)
+        self.assertEqual(len(turn.answer), main.Config.HISTORY_MAX_TURN_CHARS)
+
+    def test_summary_is_truncated(self):
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="s" * 10000))],
+            usage=None
+        )
+        openai = mock.Mock()
+        openai.chat.completions.create.return_value = response
+        with mock.patch.object(main, "get_openai", return_value=openai):
+            summary = main.summarize_turns("", [main.ConversationTurn("q", "a")])
+
+        self.assertEqual(len(summary), main.Config.HISTORY_MAX_SUMMARY_CHARS)
+
+    def test_oldest_turns_roll_up_into_summary(self):
+        store = self.make_store()
+        max_turns = main.Config.HISTORY_MAX_TURNS
+        batch = main.Config.HISTORY_SUMMARY_BATCH
+        with mock.patch.object(main, "summarize_turns", side_effect=fake_summarize) as summarize:
+            for i in range(max_turns + 1):
+                store.add_turn(1, f"q{i}", f"a{i}")
+
+        summary, turns = store.get_context(1)
+        self.assertEqual(summarize.call_count, 1)
+        self.assertEqual(summary, " ".join(f"q{i}" for i in range(batch)))
+        self.assertEqual([t.query for t in turns],
+                         [f"q{i}" for i in range(batch, max_turns + 1)])
+
+    def test_clear_during_summary_does_not_resurrect_chat(self):
+        store = self.make_store()
+        summarizing = threading.Event()
+        cleared = threading.Event()
+
+        def slow_summarize(summary, turns):
+            summarizing.set()
+            cleared.wait(5)
+            return "old conversation"
+
+        for i in range(main.Config.HISTORY_MAX_TURNS):
+            store.add_turn(1, f"q{i}", f"a{i}")
+
+        with mock.patch.object(main, "summarize_turns", side_effect=slow_summarize):
+            adder = threading.Thread(target=store.add_turn, args=(1, "last", "answer"))
+            adder.start()
+            self.assertTrue(summarizing.wait(5))
+            store.clear(1)
+            cleared.set()
+            adder.join()
+
+        self.assertEqual(store.get_context(1), ("", []))
+
+    def test_clear_then_new_turns_keep_new_conversation(self):
+        store = self.make_store()
+        summarizing = threading.Event()
+        restarted = threading.Event()
+
+        def slow_summarize(summary, turns):
+            summarizing.set()
+            restarted.wait(5)
+            return "old conversation"
+
+        for i in range(main.Config.HISTORY_MAX_TURNS):
+            store.add_turn(1, f"q{i}", f"a{i}")
+
+        with mock.patch.object(main, "summarize_turns", side_effect=slow_summarize):
+            adder = threading.Thread(target=store.add_turn, args=(1, "last", "answer"))
+            adder.start()
+            self.assertTrue(summarizing.wait(5))
+            store.clear(1)
+            store.add_turn(1, "fresh", "start")
+            restarted.set()
+            adder.join()
+
+        summary, turns = store.get_context(1)
+        self.assertEqual(summary, "")
+        self.assertEqual([t.query for t in turns], ["fresh"])
+
+
+class SQLiteConversationStoreTest(ConversationStoreTest):
+    """Same behaviour with history persisted to SQLite"""
+
+    def make_store(self):
+        return main.ConversationStore(main.SQLiteConversationBackend(self.db_file))
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmpdir.name, "conversations.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_least_recently_used_chats_are_evicted(self):
+        # Evicted chats are reloaded from the database
+        store = self.make_store()
+        with mock.patch.object(main.Config, "HISTORY_MAX_CHATS", 1):
+            store.add_turn(1, "q1", "a1")
+            store.add_turn(2, "q2", "a2")
+            self.assertEqual(store.memory_usage()["active_chats"], 1)
+            self.assertEqual([t.query for t in store.get_context(1)[1]], ["q1"])
+
+    def test_history_survives_restart(self):
+        with mock.patch.object(main, "summarize_turns", side_effect=fake_summarize):
+            store = self.make_store()
+            for i in range(main.Config.HISTORY_MAX_TURNS + 1):
+                store.add_turn(1, f"q{i}", f"a{i}")
+            expected = store.get_context(1)
+
+        summary, turns = self.make_store().get_context(1)
+        self.assertEqual(summary, expected[0])
+        self.assertEqual([t.to_dict() for t in turns], [t.to_dict() for t in expected[1]])
+
+    def test_clear_deletes_persisted_history(self):
+        store = self.make_store()
+        store.add_turn(1, "q", "a")
+        store.clear(1)
+
+        self.assertEqual(self.make_store().get_context(1), ("", []))
+
+
+if __name__ == "__main__":
+    unittest.main()